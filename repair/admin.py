@@ -1,5 +1,9 @@
 from django.contrib import admin
-from django.utils.html import format_html
+from django.contrib.admin.views.main import ChangeList
+from django.db.models import Value
+from django.db.models.functions import Concat, Trim
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from .models import (
@@ -7,6 +11,52 @@ from .models import (
     Repair, RepairWork, RepairComponent, RepairAct
 )
 
+WORKS_TABLE_HEADER = mark_safe(
+    '<tr><th style="border: 1px solid #ddd; padding: 8px;">Вид работы</th>'
+    '<th style="border: 1px solid #ddd; padding: 8px;">Количество</th>'
+    '<th style="border: 1px solid #ddd; padding: 8px;">Цена</th>'
+    '<th style="border: 1px solid #ddd; padding: 8px;">Стоимость</th></tr>'
+)
+
+COMPONENTS_TABLE_HEADER = mark_safe(
+    '<tr><th style="border: 1px solid #ddd; padding: 8px;">Компонент</th>'
+    '<th style="border: 1px solid #ddd; padding: 8px;">Количество</th>'
+    '<th style="border: 1px solid #ddd; padding: 8px;">Цена</th>'
+    '<th style="border: 1px solid #ddd; padding: 8px;">Стоимость</th></tr>'
+)
+
+
+def client_full_name_expression(client_path):
+    """ФИО клиента, собранное на стороне БД (аналог Client.full_name)"""
+    return Trim(Concat(
+        f'{client_path}__last_name', Value(' '),
+        f'{client_path}__first_name', Value(' '),
+        f'{client_path}__middle_name',
+    ))
+
+
+class RepairChangeList(ChangeList):
+    """Список ремонтов: ФИО клиента собирается в БД"""
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            client_full_name=client_full_name_expression('device__client')
+        )
+
+
+class RepairActChangeList(ChangeList):
+    """Список актов: только отображаемые колонки, ФИО клиента собирается в БД"""
+    only_fields = ('act_number', 'created_at', 'printed_at', 'repair_id', 'repair__total_cost')
+
+    def get_queryset(self, request):
+        # Связи списка задаются только здесь: устройство и клиент из
+        # get_queryset админки не нужны, ФИО подставляет аннотация
+        return super().get_queryset(request).select_related(None).select_related('repair').only(
+            *self.only_fields
+        ).annotate(
+            client_full_name=client_full_name_expression('repair__device__client')
+        )
+
 
 @admin.register(Client)
 class ClientAdmin(admin.ModelAdmin):
@@ -51,6 +101,12 @@ class RepairWorkInline(admin.TabularInline):
     extra = 1
     fields = ('work_type', 'quantity', 'unit_price', 'cost', 'notes')
     readonly_fields = ('cost',)
+    raw_id_fields = ('work_type',)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'work_type':
+            kwargs['queryset'] = WorkType.objects.only('id', 'name', 'standard_price')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
 class RepairComponentInline(admin.TabularInline):
@@ -58,6 +114,12 @@ class RepairComponentInline(admin.TabularInline):
     extra = 1
     fields = ('component', 'quantity', 'unit_price', 'total_cost', 'was_purchased', 'notes')
     readonly_fields = ('total_cost',)
+    raw_id_fields = ('component',)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'component':
+            kwargs['queryset'] = Component.objects.only('id', 'name', 'quantity', 'unit_price')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
 @admin.register(Repair)
@@ -66,6 +128,7 @@ class RepairAdmin(admin.ModelAdmin):
     list_filter = ('status', 'accepted_at', 'created_by')
     search_fields = ('device__brand', 'device__model', 'device__client__first_name', 'device__client__last_name')
     readonly_fields = ('accepted_at', 'total_cost')
+    list_select_related = ('device', 'created_by')
     fieldsets = (
         ('Основная информация', {
             'fields': ('device', 'problem_description', 'status', 'created_by')
@@ -87,8 +150,11 @@ class RepairAdmin(admin.ModelAdmin):
         return format_html('<a href="{}">{}</a>', url, obj.device)
     device_link.short_description = 'Техника'
 
+    def get_changelist(self, request, **kwargs):
+        return RepairChangeList
+
     def client_name(self, obj):
-        return obj.device.client.full_name
+        return obj.client_full_name
     client_name.short_description = 'Клиент'
 
     def save_model(self, request, obj, form, change):
@@ -96,6 +162,19 @@ class RepairAdmin(admin.ModelAdmin):
             obj.created_by = request.user
         super().save_model(request, obj, form, change)
 
+    def save_formset(self, request, form, formset, change):
+        if formset.model not in (RepairWork, RepairComponent):
+            return super().save_formset(request, form, formset, change)
+        formset.save(commit=False)
+        for obj in formset.deleted_objects:
+            obj.delete()
+        for obj, changed_fields in formset.changed_objects:
+            obj.save()
+        # Новые строки сохраняем одним запросом, минуя построчный save()
+        if formset.new_objects:
+            formset.model.bulk_create_for_repair(form.instance, formset.new_objects)
+        formset.save_m2m()
+
 
 @admin.register(RepairAct)
 class RepairActAdmin(admin.ModelAdmin):
@@ -121,8 +200,14 @@ class RepairActAdmin(admin.ModelAdmin):
         return format_html('<a href="{}">Ремонт #{}</a>', url, obj.repair.id)
     repair_link.short_description = 'Ремонт'
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('repair__device__client')
+
+    def get_changelist(self, request, **kwargs):
+        return RepairActChangeList
+
     def client_name(self, obj):
-        return obj.repair.device.client.full_name
+        return obj.client_full_name
     client_name.short_description = 'Клиент'
 
     def repair_info(self, obj):
@@ -142,43 +227,41 @@ class RepairActAdmin(admin.ModelAdmin):
     repair_info.short_description = 'Информация о ремонте'
 
     def works_list(self, obj):
-        works = obj.repair.works.all()
+        works = obj.repair.works.select_related('work_type').only(
+            'repair', 'quantity', 'unit_price', 'cost', 'work_type__name'
+        )
         if not works:
             return 'Работы не указаны'
-        html = '<table style="width: 100%; border-collapse: collapse;">'
-        html += '<tr><th style="border: 1px solid #ddd; padding: 8px;">Вид работы</th>'
-        html += '<th style="border: 1px solid #ddd; padding: 8px;">Количество</th>'
-        html += '<th style="border: 1px solid #ddd; padding: 8px;">Цена</th>'
-        html += '<th style="border: 1px solid #ddd; padding: 8px;">Стоимость</th></tr>'
-        for work in works:
-            html += f'<tr>'
-            html += f'<td style="border: 1px solid #ddd; padding: 8px;">{work.work_type.name}</td>'
-            html += f'<td style="border: 1px solid #ddd; padding: 8px;">{work.quantity}</td>'
-            html += f'<td style="border: 1px solid #ddd; padding: 8px;">{work.unit_price} руб.</td>'
-            html += f'<td style="border: 1px solid #ddd; padding: 8px;">{work.cost} руб.</td>'
-            html += f'</tr>'
-        html += '</table>'
-        return mark_safe(html)
+        rows = format_html_join(
+            '',
+            '<tr>'
+            '<td style="border: 1px solid #ddd; padding: 8px;">{}</td>'
+            '<td style="border: 1px solid #ddd; padding: 8px;">{}</td>'
+            '<td style="border: 1px solid #ddd; padding: 8px;">{} руб.</td>'
+            '<td style="border: 1px solid #ddd; padding: 8px;">{} руб.</td>'
+            '</tr>',
+            ((work.work_type.name, work.quantity, work.unit_price, work.cost) for work in works)
+        )
+        return format_html('<table style="width: 100%; border-collapse: collapse;">{}{}</table>', WORKS_TABLE_HEADER, rows)
     works_list.short_description = 'Выполненные работы'
 
     def components_list(self, obj):
-        components = obj.repair.components.all()
+        components = obj.repair.components.select_related('component').only(
+            'repair', 'quantity', 'unit_price', 'total_cost', 'component__name'
+        )
         if not components:
             return 'Компоненты не использовались'
-        html = '<table style="width: 100%; border-collapse: collapse;">'
-        html += '<tr><th style="border: 1px solid #ddd; padding: 8px;">Компонент</th>'
-        html += '<th style="border: 1px solid #ddd; padding: 8px;">Количество</th>'
-        html += '<th style="border: 1px solid #ddd; padding: 8px;">Цена</th>'
-        html += '<th style="border: 1px solid #ddd; padding: 8px;">Стоимость</th></tr>'
-        for comp in components:
-            html += f'<tr>'
-            html += f'<td style="border: 1px solid #ddd; padding: 8px;">{comp.component.name}</td>'
-            html += f'<td style="border: 1px solid #ddd; padding: 8px;">{comp.quantity}</td>'
-            html += f'<td style="border: 1px solid #ddd; padding: 8px;">{comp.unit_price} руб.</td>'
-            html += f'<td style="border: 1px solid #ddd; padding: 8px;">{comp.total_cost} руб.</td>'
-            html += f'</tr>'
-        html += '</table>'
-        return mark_safe(html)
+        rows = format_html_join(
+            '',
+            '<tr>'
+            '<td style="border: 1px solid #ddd; padding: 8px;">{}</td>'
+            '<td style="border: 1px solid #ddd; padding: 8px;">{}</td>'
+            '<td style="border: 1px solid #ddd; padding: 8px;">{} руб.</td>'
+            '<td style="border: 1px solid #ddd; padding: 8px;">{} руб.</td>'
+            '</tr>',
+            ((comp.component.name, comp.quantity, comp.unit_price, comp.total_cost) for comp in components)
+        )
+        return format_html('<table style="width: 100%; border-collapse: collapse;">{}{}</table>', COMPONENTS_TABLE_HEADER, rows)
     components_list.short_description = 'Использованные компоненты'
 
     def total_cost_display(self, obj):
@@ -187,7 +270,6 @@ class RepairActAdmin(admin.ModelAdmin):
 
     def save_model(self, request, obj, form, change):
         if 'printed_at' in form.changed_data and obj.printed_at is None:
-            from django.utils import timezone
             obj.printed_at = timezone.now()
         super().save_model(request, obj, form, change)
 
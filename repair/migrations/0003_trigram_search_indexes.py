@@ -0,0 +1,55 @@
+from django.db import migrations
+
+# Все колонки из search_fields админок: поиск объединяет их через OR,
+# и индекс используется, только если проиндексирована каждая колонка.
+# icontains в PostgreSQL строится как UPPER(col) LIKE UPPER(%s),
+# поэтому индексируем то же выражение.
+TRIGRAM_INDEXES = [
+    ('repair_client', 'first_name'),
+    ('repair_client', 'last_name'),
+    ('repair_client', 'middle_name'),
+    ('repair_client', 'phone'),
+    ('repair_client', 'email'),
+    ('repair_device', 'brand'),
+    ('repair_device', 'model'),
+    ('repair_device', 'serial_number'),
+    ('repair_component', 'name'),
+    ('repair_component', 'part_number'),
+    ('repair_component', 'supplier'),
+    ('repair_worktype', 'name'),
+    ('repair_worktype', 'description'),
+    ('repair_repairact', 'act_number'),
+]
+
+
+def index_name(table, column):
+    return f'{table}_{column}_trgm'
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{index_name(table, column)}" '
+            f'ON "{table}" USING gin (UPPER("{column}") gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{index_name(table, column)}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repair', '0002_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
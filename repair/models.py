@@ -1,6 +1,38 @@
-from django.db import models
+import threading
+import weakref
+
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator
 from django.utils import timezone
+from django.utils.functional import cached_property
+
+
+class _PendingRecomputes(threading.local):
+    """Запланированные пересчеты стоимости ремонтов текущего потока.
+
+    Колбэки хранятся по слабым ссылкам: при откате транзакции Django
+    отбрасывает их из очереди on_commit, и запись исчезает сама.
+    """
+
+    def __init__(self):
+        self.callbacks = weakref.WeakValueDictionary()
+
+
+_pending_recomputes = _PendingRecomputes()
+
+
+class RepairLineMixin:
+    """Строка ремонта (работа или компонент), помнящая ремонт, с которым загружена"""
+    _loaded_repair_id = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Через __dict__, чтобы не загружать отложенное поле
+        instance._loaded_repair_id = instance.__dict__.get('repair_id')
+        return instance
 
 
 class Client(models.Model):
@@ -17,11 +49,14 @@ class Client(models.Model):
         verbose_name = 'Клиент'
         verbose_name_plural = 'Клиенты'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['last_name', 'first_name'], name='client_name_idx'),
+        ]
 
     def __str__(self):
         return f"{self.last_name} {self.first_name} {self.middle_name}".strip()
 
-    @property
+    @cached_property
     def full_name(self):
         return f"{self.last_name} {self.first_name} {self.middle_name}".strip()
 
@@ -56,6 +91,9 @@ class Device(models.Model):
         verbose_name = 'Техника'
         verbose_name_plural = 'Техника'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['brand', 'model'], name='device_brand_model_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_device_type_display()} {self.brand} {self.model}"
@@ -138,32 +176,73 @@ class Repair(models.Model):
         verbose_name = 'Ремонт'
         verbose_name_plural = 'Ремонты'
         ordering = ['-accepted_at']
+        indexes = [
+            models.Index(fields=['status', '-accepted_at'], name='repair_status_accepted_idx'),
+            models.Index(fields=['created_by', '-accepted_at'], name='repair_master_accepted_idx'),
+        ]
 
     def __str__(self):
         repair_id = self.id if self.id else 'новый'
         return f"Ремонт #{repair_id} - {self.device} ({self.get_status_display()})"
 
+    @classmethod
+    def total_cost_expression(cls):
+        """Сумма работ и компонентов ремонта как выражение над OuterRef('pk')"""
+        works_total = RepairWork.objects.filter(repair=OuterRef('pk')).values('repair').annotate(
+            total=Sum('cost')
+        ).values('total')
+        components_total = RepairComponent.objects.filter(repair=OuterRef('pk')).values('repair').annotate(
+            total=Sum('total_cost')
+        ).values('total')
+        zero = Value(0, output_field=models.DecimalField(max_digits=10, decimal_places=2))
+        return Coalesce(Subquery(works_total), zero) + Coalesce(Subquery(components_total), zero)
+
     def calculate_total_cost(self):
         """Расчет общей стоимости ремонта"""
         if not self.pk:
             return 0
-        total = 0
-        # Стоимость работ
-        for work in self.works.all():
-            total += work.cost
-        # Стоимость компонентов
-        for component in self.components.all():
-            total += component.total_cost
-        return total
-
-    def save(self, *args, **kwargs):
-        # Пересчитываем стоимость только если repair уже сохранен
-        if self.pk:
+        # Обе суммы считаются на стороне БД одним запросом
+        return Repair.objects.filter(pk=self.pk).annotate(
+            calculated_total=self.total_cost_expression()
+        ).values_list('calculated_total', flat=True).get()
+
+    def save(self, *args, recalculate=False, **kwargs):
+        # Полный пересчет стоимости только по явному запросу:
+        # работы и компоненты планируют пересчет сами
+        if recalculate and self.pk:
             self.total_cost = self.calculate_total_cost()
+        elif not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # total_cost в памяти может быть устаревшим - не перезаписываем его
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'total_cost' and field.attname not in deferred
+            ]
         super().save(*args, **kwargs)
 
+    @classmethod
+    def recompute_total_cost(cls, repair_id):
+        """Пересчитать и записать стоимость ремонта одним UPDATE"""
+        # Если ремонт уже удален, UPDATE просто не затронет строк
+        cls.objects.filter(pk=repair_id).update(total_cost=cls.total_cost_expression())
+
+    @classmethod
+    def schedule_total_cost_recompute(cls, *repair_ids):
+        """Пересчитать стоимость ремонтов один раз после фиксации транзакции"""
+        pending = _pending_recomputes.callbacks
+        for repair_id in set(repair_ids) - {None}:
+            if repair_id in pending:
+                continue
+
+            def recompute(repair_id=repair_id):
+                pending.pop(repair_id, None)
+                cls.recompute_total_cost(repair_id)
 
-class RepairWork(models.Model):
+            pending[repair_id] = recompute
+            transaction.on_commit(recompute)
+
+
+class RepairWork(RepairLineMixin, models.Model):
     """Выполненная работа в ремонте"""
     repair = models.ForeignKey(
         Repair,
@@ -193,13 +272,26 @@ class RepairWork(models.Model):
     def save(self, *args, **kwargs):
         self.cost = self.unit_price * self.quantity
         super().save(*args, **kwargs)
-        # Обновляем общую стоимость ремонта
-        if self.repair.pk:
-            self.repair.total_cost = self.repair.calculate_total_cost()
-            self.repair.save(update_fields=['total_cost'])
-
-
-class RepairComponent(models.Model):
+        # Строку могли перенести в другой ремонт: пересчитываем и прежний
+        Repair.schedule_total_cost_recompute(self.repair_id, self._loaded_repair_id)
+        self._loaded_repair_id = self.repair_id
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        Repair.schedule_total_cost_recompute(self.repair_id)
+        return result
+
+    @classmethod
+    def bulk_create_for_repair(cls, repair, works):
+        """Массовое добавление работ с одним пересчетом стоимости ремонта"""
+        for work in works:
+            work.repair = repair
+            work.cost = work.unit_price * work.quantity
+        cls.objects.bulk_create(works)
+        Repair.schedule_total_cost_recompute(repair.pk)
+
+
+class RepairComponent(RepairLineMixin, models.Model):
     """Использованный компонент в ремонте"""
     repair = models.ForeignKey(
         Repair,
@@ -230,15 +322,37 @@ class RepairComponent(models.Model):
     def save(self, *args, **kwargs):
         self.total_cost = self.unit_price * self.quantity
         super().save(*args, **kwargs)
-        # Обновляем общую стоимость ремонта
-        if self.repair.pk:
-            self.repair.total_cost = self.repair.calculate_total_cost()
-            self.repair.save(update_fields=['total_cost'])
+        # Строку могли перенести в другой ремонт: пересчитываем и прежний
+        Repair.schedule_total_cost_recompute(self.repair_id, self._loaded_repair_id)
+        self._loaded_repair_id = self.repair_id
 
         # Уменьшаем количество на складе, если компонент был взят со склада
-        if not self.was_purchased and self.component.quantity >= self.quantity:
-            self.component.quantity -= self.quantity
-            self.component.save(update_fields=['quantity'])
+        if not self.was_purchased:
+            Component.objects.filter(pk=self.component_id, quantity__gte=self.quantity).update(
+                quantity=F('quantity') - self.quantity
+            )
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        Repair.schedule_total_cost_recompute(self.repair_id)
+        return result
+
+    @classmethod
+    def bulk_create_for_repair(cls, repair, components):
+        """Массовое добавление компонентов с одним пересчетом стоимости ремонта"""
+        for component in components:
+            component.repair = repair
+            component.total_cost = component.unit_price * component.quantity
+        cls.objects.bulk_create(components)
+        Repair.schedule_total_cost_recompute(repair.pk)
+
+        # Списываем со склада построчно, как при обычном save():
+        # строка, на которую не хватает остатка, не списывается
+        for component in components:
+            if not component.was_purchased:
+                Component.objects.filter(pk=component.component_id, quantity__gte=component.quantity).update(
+                    quantity=F('quantity') - component.quantity
+                )
 
 
 class RepairAct(models.Model):
@@ -254,6 +368,8 @@ class RepairAct(models.Model):
     printed_at = models.DateTimeField('Дата печати', null=True, blank=True)
     notes = models.TextField('Дополнительные примечания', blank=True)
 
+    ACT_PREFIX = 'ACT-'
+
     class Meta:
         verbose_name = 'Акт выполненных работ'
         verbose_name_plural = 'Акты выполненных работ'
@@ -265,7 +381,6 @@ class RepairAct(models.Model):
     def save(self, *args, **kwargs):
         if not self.act_number:
             # Генерируем номер акта
-            from datetime import datetime
-            self.act_number = f"ACT-{datetime.now().strftime('%Y%m%d')}-{self.repair.id}"
+            self.act_number = f"{self.ACT_PREFIX}{timezone.localdate():%Y%m%d}-{self.repair_id}"
         super().save(*args, **kwargs)
 
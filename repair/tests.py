@@ -1,4 +1,203 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import TransactionTestCase
+from django.urls import reverse
 
+from .models import (
+    Client, Device, Component, WorkType,
+    Repair, RepairWork, RepairComponent
+)
+
+
+def formset_data(prefix, rows, initial_forms):
+    """POST-данные инлайн-формсета админки"""
+    data = {
+        f'{prefix}-TOTAL_FORMS': str(len(rows)),
+        f'{prefix}-INITIAL_FORMS': str(initial_forms),
+        f'{prefix}-MIN_NUM_FORMS': '0',
+        f'{prefix}-MAX_NUM_FORMS': '1000',
+    }
+    for index, row in enumerate(rows):
+        for field, value in row.items():
+            data[f'{prefix}-{index}-{field}'] = value
+    return data
+
+
+class RepairFixtureMixin:
+    """Общие данные: клиент, техника, ремонт, вид работы и компонент"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        client = Client.objects.create(first_name='Иван', last_name='Иванов', phone='+70000000000')
+        self.device = Device.objects.create(client=client, device_type='tv', brand='Sony', model='X1')
+        self.repair = Repair.objects.create(
+            device=self.device, problem_description='Не включается', created_by=self.user
+        )
+        self.work_type = WorkType.objects.create(name='Диагностика', standard_price=Decimal('10.00'))
+        self.component = Component.objects.create(name='Предохранитель', quantity=6, unit_price=Decimal('3.00'))
+
+
+class TotalCostRecomputeTests(RepairFixtureMixin, TransactionTestCase):
+
+    def add_work(self, unit_price, repair=None):
+        return RepairWork.objects.create(
+            repair=repair or self.repair, work_type=self.work_type, quantity=1, unit_price=Decimal(unit_price)
+        )
+
+    def assertTotalCost(self, repair, expected):
+        repair.refresh_from_db()
+        self.assertEqual(repair.total_cost, Decimal(expected))
+
+    def test_recompute_runs_once_per_atomic_block(self):
+        with mock.patch.object(Repair, 'recompute_total_cost', wraps=Repair.recompute_total_cost) as recompute:
+            with transaction.atomic():
+                for _ in range(3):
+                    self.add_work('10.00')
+                recompute.assert_not_called()
+            recompute.assert_called_once_with(self.repair.pk)
+        self.assertTotalCost(self.repair, '30.00')
+
+    def test_recompute_is_rescheduled_after_rollback(self):
+        class Rollback(Exception):
+            pass
+
+        with self.assertRaises(Rollback):
+            with transaction.atomic():
+                self.add_work('10.00')
+                raise Rollback
+        with transaction.atomic():
+            self.add_work('5.00')
+        self.assertTotalCost(self.repair, '5.00')
+
+    def test_recompute_is_rescheduled_after_savepoint_rollback(self):
+        class Rollback(Exception):
+            pass
+
+        with transaction.atomic():
+            with self.assertRaises(Rollback):
+                with transaction.atomic():
+                    self.add_work('10.00')
+                    raise Rollback
+            self.add_work('5.00')
+        self.assertTotalCost(self.repair, '5.00')
+
+    def test_delete_recomputes_total(self):
+        work = self.add_work('10.00')
+        self.assertTotalCost(self.repair, '10.00')
+        work.delete()
+        self.assertTotalCost(self.repair, '0.00')
+
+    def test_delete_with_repair_in_same_transaction(self):
+        work = self.add_work('10.00')
+        with transaction.atomic():
+            work.delete()
+            self.repair.delete()
+        self.assertFalse(Repair.objects.exists())
+
+    def test_moving_work_recomputes_both_repairs(self):
+        other = Repair.objects.create(device=self.device, problem_description='Шумит', created_by=self.user)
+        work = self.add_work('10.00')
+        work.repair = other
+        work.save()
+        self.assertTotalCost(self.repair, '0.00')
+        self.assertTotalCost(other, '10.00')
+
+    def test_moving_loaded_work_recomputes_both_repairs(self):
+        other = Repair.objects.create(device=self.device, problem_description='Шумит', created_by=self.user)
+        work = RepairWork.objects.get(pk=self.add_work('10.00').pk)
+        work.repair = other
+        work.save()
+        self.assertTotalCost(self.repair, '0.00')
+        self.assertTotalCost(other, '10.00')
+
+    def test_update_save_does_not_reread_row(self):
+        work = RepairWork.objects.get(pk=self.add_work('10.00').pk)
+        work.quantity = 2
+        # UPDATE строки и UPDATE стоимости ремонта
+        with self.assertNumQueries(2):
+            work.save()
+        self.assertTotalCost(self.repair, '20.00')
+
+    def test_repair_save_keeps_total_cost_from_children(self):
+        self.add_work('10.00')
+        self.repair.status = 'ready'
+        self.repair.save()
+        self.assertTotalCost(self.repair, '10.00')
+        self.assertEqual(self.repair.status, 'ready')
+
+
+class BulkCreateForRepairTests(RepairFixtureMixin, TransactionTestCase):
+
+    def test_stock_is_checked_per_row(self):
+        rows = [
+            RepairComponent(component=self.component, quantity=4, unit_price=Decimal('3.00')),
+            RepairComponent(component=self.component, quantity=4, unit_price=Decimal('3.00')),
+        ]
+        RepairComponent.bulk_create_for_repair(self.repair, rows)
+
+        self.component.refresh_from_db()
+        self.assertEqual(self.component.quantity, 2)
+        self.repair.refresh_from_db()
+        self.assertEqual(self.repair.total_cost, Decimal('24.00'))
+
+    def test_purchased_components_do_not_use_stock(self):
+        rows = [
+            RepairComponent(component=self.component, quantity=4, unit_price=Decimal('3.00'), was_purchased=True),
+        ]
+        RepairComponent.bulk_create_for_repair(self.repair, rows)
+
+        self.component.refresh_from_db()
+        self.assertEqual(self.component.quantity, 6)
+
+
+class RepairAdminSaveFormsetTests(RepairFixtureMixin, TransactionTestCase):
+
+    def test_mixed_formset_updates_total_and_stock(self):
+        changed = RepairWork.objects.create(
+            repair=self.repair, work_type=self.work_type, quantity=1, unit_price=Decimal('10.00')
+        )
+        deleted = RepairWork.objects.create(
+            repair=self.repair, work_type=self.work_type, quantity=2, unit_price=Decimal('10.00')
+        )
+        self.client.force_login(self.user)
+
+        data = {
+            'device': str(self.device.pk),
+            'problem_description': self.repair.problem_description,
+            'status': self.repair.status,
+            'created_by': str(self.user.pk),
+            'started_at_0': '', 'started_at_1': '',
+            'completed_at_0': '', 'completed_at_1': '',
+            'issued_at_0': '', 'issued_at_1': '',
+            'master_notes': '',
+        }
+        work_row = {'repair': str(self.repair.pk), 'work_type': str(self.work_type.pk), 'notes': ''}
+        data.update(formset_data('works', [
+            dict(work_row, id=str(changed.pk), quantity='2', unit_price='10.00'),
+            dict(work_row, id=str(deleted.pk), quantity='2', unit_price='10.00', DELETE='on'),
+            dict(work_row, id='', quantity='1', unit_price='5.00'),
+        ], initial_forms=2))
+        component_row = {
+            'id': '', 'repair': str(self.repair.pk), 'component': str(self.component.pk),
+            'quantity': '4', 'unit_price': '3.00', 'notes': '',
+        }
+        data.update(formset_data('components', [component_row, component_row], initial_forms=0))
+
+        with mock.patch.object(Repair, 'recompute_total_cost', wraps=Repair.recompute_total_cost) as recompute:
+            response = self.client.post(reverse('admin:repair_repair_change', args=[self.repair.pk]), data)
+
+        self.assertEqual(response.status_code, 302)
+        recompute.assert_called_once_with(self.repair.pk)
+        self.assertFalse(RepairWork.objects.filter(pk=deleted.pk).exists())
+        self.assertEqual(RepairWork.objects.get(pk=changed.pk).cost, Decimal('20.00'))
+        self.assertEqual(self.repair.works.count(), 2)
+        self.assertEqual(self.repair.components.count(), 2)
+        self.repair.refresh_from_db()
+        # 20 (измененная) + 5 (новая) работы и 2 x 12 компоненты
+        self.assertEqual(self.repair.total_cost, Decimal('49.00'))
+        self.component.refresh_from_db()
+        self.assertEqual(self.component.quantity, 2)
@@ -1,17 +1,38 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
-from .models import Repair, Client, Component, RepairAct
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Count, Exists, OuterRef, Prefetch, Q
+from .models import Repair, RepairWork, RepairComponent, Client, Component, RepairAct
+
+INDEX_STATS_CACHE_KEY = 'repair:index_stats'
+INDEX_STATS_CACHE_TIMEOUT = 60
+PAGE_SIZE = 50
+
+
+def paginate(request, queryset):
+    """Страница списка и строка GET-параметров без номера страницы"""
+    page = Paginator(queryset, PAGE_SIZE).get_page(request.GET.get('page'))
+    query = request.GET.copy()
+    query.pop('page', None)
+    return page, query.urlencode()
 
 
 def index(request):
     """Главная страница"""
-    context = {
-        'total_repairs': Repair.objects.count(),
-        'active_repairs': Repair.objects.exclude(status__in=['completed', 'cancelled', 'unrepairable']).count(),
-        'total_clients': Client.objects.count(),
-        'low_stock_components': Component.objects.filter(quantity__lt=5).count(),
-    }
+    context = cache.get(INDEX_STATS_CACHE_KEY)
+    if context is None:
+        repairs = Repair.objects.aggregate(
+            total=Count('id'),
+            active=Count('id', filter=~Q(status__in=['completed', 'cancelled', 'unrepairable'])),
+        )
+        context = {
+            'total_repairs': repairs['total'],
+            'active_repairs': repairs['active'],
+            'total_clients': Client.objects.count(),
+            'low_stock_components': Component.objects.filter(quantity__lt=5).count(),
+        }
+        cache.set(INDEX_STATS_CACHE_KEY, context, INDEX_STATS_CACHE_TIMEOUT)
     return render(request, 'repair/index.html', context)
 
 
@@ -34,8 +55,11 @@ def repair_list(request):
             Q(device__client__last_name__icontains=search_query)
         )
 
+    repairs, page_query = paginate(request, repairs)
+
     context = {
         'repairs': repairs,
+        'page_query': page_query,
         'status_filter': status_filter,
         'search_query': search_query,
         'status_choices': Repair.STATUS_CHOICES,
@@ -47,17 +71,24 @@ def repair_list(request):
 def repair_detail(request, repair_id):
     """Детальная информация о ремонте"""
     repair = get_object_or_404(
-        Repair.objects.select_related('device', 'device__client', 'created_by'),
+        Repair.objects.select_related('device', 'device__client', 'created_by').prefetch_related(
+            Prefetch('works', queryset=RepairWork.objects.select_related('work_type').only(
+                'repair_id', 'quantity', 'unit_price', 'cost', 'notes', 'work_type__name'
+            ), to_attr='prefetched_works'),
+            Prefetch('components', queryset=RepairComponent.objects.select_related('component').only(
+                'repair_id', 'quantity', 'unit_price', 'total_cost', 'was_purchased', 'notes', 'component__name'
+            ), to_attr='prefetched_components'),
+        ).annotate(
+            has_act=Exists(RepairAct.objects.filter(repair=OuterRef('pk')))
+        ),
         id=repair_id
     )
-    works = repair.works.select_related('work_type').all()
-    components = repair.components.select_related('component').all()
 
     context = {
         'repair': repair,
-        'works': works,
-        'components': components,
-        'has_act': hasattr(repair, 'act'),
+        'works': repair.prefetched_works,
+        'components': repair.prefetched_components,
+        'has_act': repair.has_act,
     }
     return render(request, 'repair/repair_detail.html', context)
 
@@ -89,7 +120,7 @@ def repair_act(request, repair_id):
 def client_list(request):
     """Список клиентов"""
     search_query = request.GET.get('search', '')
-    clients = Client.objects.prefetch_related('devices').all()
+    clients = Client.objects.annotate(device_count=Count('devices'))
 
     if search_query:
         clients = clients.filter(
@@ -99,8 +130,11 @@ def client_list(request):
             Q(email__icontains=search_query)
         )
 
+    clients, page_query = paginate(request, clients)
+
     context = {
         'clients': clients,
+        'page_query': page_query,
         'search_query': search_query,
     }
     return render(request, 'repair/client_list.html', context)
@@ -124,8 +158,11 @@ def component_list(request):
     if low_stock:
         components = components.filter(quantity__lt=5)
 
+    components, page_query = paginate(request, components)
+
     context = {
         'components': components,
+        'page_query': page_query,
         'search_query': search_query,
         'low_stock': low_stock,
     }